@@ -1,20 +1,37 @@
 # --- Full End-to-End Contact Finder and Outreach Bot (with Timestamped Reports) ---
 
-import pandas as pd
 import re
+import regex
+import orjson
+import xlsxwriter
+from python_calamine import CalamineWorkbook
+from selectolax.parser import HTMLParser
+from urllib.parse import unquote
+import asyncio
+import aiohttp
+import diskcache
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, List, Dict, Any
+from typing import TypedDict, List, Dict, Set, Any, Optional, BinaryIO, Iterable, Sequence
 from dotenv import load_dotenv
 import os
-import requests
-from bs4 import BeautifulSoup
-import smtplib
+import sys
+from dataclasses import dataclass, field
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import aiosmtplib
 from email.message import EmailMessage
 from datetime import datetime
 
 # --- 1. SETUP AND INITIALIZATION ---
 load_dotenv()
 
+# Settings are read once here rather than on every use.
+SENDER_EMAIL = os.getenv("EMAIL_SENDER")
+SENDER_PASSWORD = os.getenv("EMAIL_PASSWORD")
+MAX_API_CALLS = os.getenv("MAX_API_CALLS", 100)
+RUN_TIMESTAMP = datetime.now().strftime("%Y-%m-%d_%H%M%S")  # Filename-safe format
+OUTPUT_FOLDER = "reports"
+
 try:
     from langchain_community.tools.tavily_search import TavilySearchResults
 
@@ -24,35 +41,278 @@ except Exception as e:
     print(f"❌ FAILED to initialize Tavily: {e}. Exiting.")
     exit()
 
+# How many people are processed at the same time, and how many are scheduled per batch.
+MAX_CONCURRENT_PEOPLE = 10
+PEOPLE_BATCH_SIZE = 100
+SOCIAL_PLATFORMS = ["LinkedIn", "Facebook", "Twitter", "Instagram"]
+# Contact sources are interned so every contact shares the same few string objects.
+SOURCE_WEBSITE = sys.intern("Official Website")
+SOURCES = {platform: sys.intern(platform) for platform in SOCIAL_PLATFORMS}
+CONTACT_COLUMNS = ["Emails", "Phones", "Contact Sources"]
+EMAIL_LOG_COLUMNS = ["Timestamp", "Name", "Email Sent To", "Source of Email"]
+# Earlier platforms win when two of them report the same contact.
+PLATFORM_RANK = {platform: rank for rank, platform in enumerate(SOCIAL_PLATFORMS)}
+
+# Tavily's client is blocking, so searches run on their own thread pool, sized so every
+# person being processed can have all of its social searches in flight at once.
+search_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PEOPLE * len(SOCIAL_PLATFORMS))
+
+# One pooled HTTP session is shared by everyone, with keep-alive connections and retries.
+HTTP_POOL_SIZE = 50
+HTTP_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=10)
+HTTP_RETRIES = 2
+HTTP_RETRY_BACKOFF = 0.3  # seconds, doubled on each retry
+HTTP_RETRY_STATUSES = {429, 502, 503, 504}
+# Only HTML pages are scraped, and only their first MAX_PAGE_BYTES.
+MAX_PAGE_BYTES = 2_000_000
+PAGE_CHUNK_BYTES = 64 * 1024
+
+# On-disk cache so reruns don't repeat searches, page downloads, or finished work.
+CACHE_DIR = os.path.join(".cache", "contact_finder")
+SEARCH_CACHE_TTL = 7 * 24 * 60 * 60  # 7 days
+PAGE_CACHE_TTL = 24 * 60 * 60  # 24 hours
+cache = diskcache.Cache(CACHE_DIR)
+
 
 # --- 2. STATE DEFINITION ---
 class GraphState(TypedDict):
     people_to_process: List[Dict[str, Any]]
-    current_person: Dict[str, Any]
-    current_person_contacts: Dict[str, Any]
-    social_platforms_to_search: List[str]
-    completed_people: List[Dict[str, Any]]
-    emails_sent_log: List[Dict[str, Any]]
+    # Completed people are streamed to a JSON Lines file instead of being kept in memory.
+    completed_columns: List[str]
+    completed_path: str
+    completed_file: BinaryIO
+    completed_count: int
+    # Column-oriented (one list per report column) so the report builds without per-row dicts.
+    email_log_cols: Dict[str, List[Any]]
+    # (message, recipient name, recipient email, source of email) waiting to be sent
+    email_queue: List[tuple]
+    platform_counts: Counter
     api_calls_made: int
     api_call_limit: int
 
 
+@dataclass(slots=True)
+class Contacts:
+    """The emails and phones found for one person, and the source each was first found on."""
+    emails: Set[str] = field(default_factory=set)
+    phones: Set[str] = field(default_factory=set)
+    sources: Dict[str, str] = field(default_factory=dict)
+
+
+class PersonState(TypedDict):
+    # 'run' is the shared GraphState of the whole run, so API call counts and logs
+    # are visible to every person being processed concurrently.
+    run: GraphState
+    http_session: aiohttp.ClientSession
+    current_person: Dict[str, Any]
+    current_person_contacts: Contacts
+    social_platforms_to_search: List[str]
+    # True once the website phase has finished, successfully or with nothing found.
+    website_done: bool
+    # True if the API limit stopped this person before any search; they are left for a later run.
+    limit_skipped: bool
+
+
 # --- 3. GRAPH NODE DEFINITIONS ---
 graph_builder = StateGraph(GraphState)
-
-EMAIL_RE = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,6}\b")
-PHONE_RE = re.compile(r"(?:\+?1[-.\s]?)?(?:\(\d{3}\)|\d{3})[-.\s]?\d{3}[-.\s]?\d{4}")
+person_graph_builder = StateGraph(PersonState)
+
+EMAIL_PATTERN = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,6}\b"
+# A phone must not be cut out of a longer digit run (prices, IDs, timestamps), hence the
+# (?<!\d)/(?!\d) guards; separators are possessive so they are never re-tried. The `regex`
+# module is used because `re` only gained possessive quantifiers in Python 3.11.
+PHONE_PATTERN = r"(?<!\d)(?:\+?1[-.\s]?+)?(?:\(\d{3}\)|\d{3})[-.\s]?+\d{3}[-.\s]?+\d{4}(?!\d)"
+# Hyperscan supports neither lookarounds nor possessive quantifiers, so it gets the plain
+# pattern and only serves as a prefilter: PHONE_RE runs when Hyperscan finds a candidate.
+HS_PHONE_PATTERN = r"(?:\+?1[-.\s]?)?(?:\(\d{3}\)|\d{3})[-.\s]?\d{3}[-.\s]?\d{4}"
+# re.ASCII gives \b the same ASCII-only meaning it has in Hyperscan.
+EMAIL_RE = re.compile(EMAIL_PATTERN, re.ASCII)
+PHONE_RE = regex.compile(PHONE_PATTERN)
+# Every phone match contains a run of three digits, so text without one can't hold a phone.
+DIGIT_RUN_RE = re.compile(r"\d{3}")
+# Asset names such as logo@2x.png look like emails; a "TLD" that is a file extension isn't one.
+ASSET_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "bmp", "avif", "css", "js"}
+
+# Optional: when python-hyperscan is installed, both patterns are compiled into one
+# database and a page is scanned for emails and phone candidates in a single pass.
+try:
+    import hyperscan
+
+    CONTACT_DB = hyperscan.Database()
+    CONTACT_DB.compile(expressions=[EMAIL_PATTERN.encode(), HS_PHONE_PATTERN.encode()], ids=[0, 1],
+                       flags=[hyperscan.HS_FLAG_SOM_LEFTMOST] * 2)
+except ImportError:
+    CONTACT_DB = None
+
+
+def _leftmost_longest(data: bytes, spans: List[tuple]) -> set:
+    """Turns Hyperscan's (start, end) match events into non-overlapping matches, like re.findall."""
+    matches = set()
+    last_end = -1
+    for start, end in sorted(spans, key=lambda span: (span[0], -span[1])):
+        if start >= last_end:
+            matches.add(data[start:end].decode('utf-8', errors='ignore'))
+            last_end = end
+    return matches
+
+
+def _drop_asset_names(emails: set) -> set:
+    return {email for email in emails if email.rsplit('.', 1)[-1].lower() not in ASSET_EXTENSIONS}
+
+
+def page_text(html: str) -> str:
+    """Returns the visible text of a page plus the targets of its mailto:/tel: links.
+
+    Scanning raw HTML would also pick up attribute values like src="logo@2x.png".
+    """
+    tree = HTMLParser(html)
+    parts = [tree.text(separator=' ')]
+    for link in tree.css('a[href]'):
+        href = link.attributes.get('href') or ''
+        scheme, _, target = href.partition(':')
+        if scheme.strip().lower() in ('mailto', 'tel'):
+            parts.append(unquote(target.split('?', 1)[0]))
+    return ' '.join(parts)
+
+
+def extract_contacts(text: str) -> tuple:
+    """Returns the (emails, phones) sets found in `text`."""
+    # Cheap checks first: without an '@' or a run of digits, the full scans can't match.
+    has_email = '@' in text
+    has_phone = DIGIT_RUN_RE.search(text) is not None
+    if not has_email and not has_phone:
+        return set(), set()
+    if CONTACT_DB is None:
+        emails = set(EMAIL_RE.findall(text)) if has_email else set()
+        phones = set(PHONE_RE.findall(text)) if has_phone else set()
+        return _drop_asset_names(emails), phones
+    # Hyperscan reports every end offset of a match, so collect spans and pick
+    # the leftmost-longest ones afterwards. Offsets are byte offsets into `data`.
+    data = text.encode('utf-8')
+    spans = ([], [])
+
+    def on_match(pattern_id, start, end, flags, context):
+        spans[pattern_id].append((start, end))
+
+    CONTACT_DB.scan(data, match_event_handler=on_match)
+    # Every PHONE_RE match is also a Hyperscan match, but not the other way round (the
+    # digit-run guards), so Hyperscan only decides whether the exact pattern has to run.
+    phones = set(PHONE_RE.findall(text)) if spans[1] else set()
+    return _drop_asset_names(_leftmost_longest(data, spans[0])), phones
+
+
+def _search_and_cache(query: str) -> Any:
+    # Caching in the worker thread keeps the results of a search we stopped waiting for.
+    results = web_search_tool.invoke(query)
+    # The tool reports a failed search (e.g. a 429) as a string instead of raising. Raise it
+    # here so the error isn't cached and the phase is retried on a later run.
+    if isinstance(results, str):
+        raise RuntimeError(results)
+    cache.set(("search", query), results, expire=SEARCH_CACHE_TTL)
+    return results
+
+
+def is_search_cached(query: str) -> bool:
+    return ("search", query) in cache
+
+
+async def cached_search(query: str) -> Any:
+    """Returns the cached Tavily results for `query`, searching only on a miss."""
+    results = cache.get(("search", query))
+    if results is None:
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(search_executor, _search_and_cache, query)
+    return results
+
+
+async def read_html(response: aiohttp.ClientResponse) -> str:
+    """Reads up to MAX_PAGE_BYTES of an HTML response; any other content type gives ""."""
+    response.raise_for_status()
+    content_type = response.headers.get('Content-Type', '')
+    # Servers that send no Content-Type at all are usually serving HTML.
+    if content_type and 'html' not in content_type:
+        print(f"    - Skipping non-HTML page ({content_type}).")
+        return ""
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(PAGE_CHUNK_BYTES):
+        body += chunk
+        if len(body) >= MAX_PAGE_BYTES:
+            break
+    del body[MAX_PAGE_BYTES:]
+    try:
+        return body.decode(response.charset or 'utf-8', errors='ignore')
+    except LookupError:
+        # The server named a charset Python doesn't know.
+        return body.decode('utf-8', errors='ignore')
+
+
+async def fetch_page(session: aiohttp.ClientSession, url: str) -> str:
+    """Returns the cached HTML for `url`, downloading it only on a miss.
+
+    Responses typed as something other than HTML (PDFs, images, ...) are not downloaded and come back as "".
+    """
+    html = cache.get(("page", url))
+    if html is not None:
+        return html
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            async with session.get(url) as response:
+                retry = response.status in HTTP_RETRY_STATUSES and attempt < HTTP_RETRIES
+                if not retry:
+                    html = await read_html(response)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == HTTP_RETRIES:
+                raise
+            retry = True
+        if not retry:
+            break
+        # Back off outside the response context, so the connection is released while we wait.
+        await asyncio.sleep(HTTP_RETRY_BACKOFF * 2 ** attempt)
+    cache.set(("page", url), html, expire=PAGE_CACHE_TTL)
+    return html
+
+
+def progress_key(person: Dict[str, Any]) -> tuple:
+    return "person_progress", str(person.get('NAME')), str(person.get('CITY', ''))
+
+
+def save_progress(state: PersonState) -> None:
+    """Saves the contacts found so far, so a crashed run can resume this person where it stopped.
+
+    Resuming skips the website phase, so nothing is saved until that phase has finished.
+    """
+    if not state['website_done']:
+        return
+    cache.set(progress_key(state['current_person']),
+              (state['website_done'], state['current_person_contacts'], state['social_platforms_to_search']),
+              expire=SEARCH_CACHE_TTL)
+
+
+def _input_cell(value: Any) -> Any:
+    """Keeps JSON-native cell values; dates, times and durations become their text form."""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
 
 
 def start_processing(state: GraphState) -> GraphState:
     print("--- Reading Excel and Initializing Workflow ---")
-    df = pd.read_excel("data.xlsx")
-    state['people_to_process'] = df.to_dict(orient="records")
-    state['completed_people'] = []
-    state['emails_sent_log'] = []
+    headers, *rows = CalamineWorkbook.from_path("data.xlsx").get_sheet_by_index(0).to_python() or [[]]
+    # Completed people go through orjson, which only takes string keys and JSON-native values.
+    headers = [str(header) for header in headers]
+    state['people_to_process'] = [dict(zip(headers, map(_input_cell, row))) for row in rows]
+    state['completed_columns'] = list(dict.fromkeys([*headers, *CONTACT_COLUMNS]))
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    state['completed_path'] = os.path.join(OUTPUT_FOLDER, f"in_progress_{RUN_TIMESTAMP}.jsonl")
+    state['completed_file'] = open(state['completed_path'], "ab", buffering=1 << 20)
+    state['completed_count'] = 0
+    state['email_log_cols'] = {column: [] for column in EMAIL_LOG_COLUMNS}
+    state['email_queue'] = []
+    state['platform_counts'] = Counter()
     state['api_calls_made'] = 0
     try:
-        state['api_call_limit'] = int(os.getenv("MAX_API_CALLS", 100))
+        state['api_call_limit'] = int(MAX_API_CALLS)
         print(f"✅ API Call Limit set to: {state['api_call_limit']}")
     except (ValueError, TypeError):
         state['api_call_limit'] = 100
@@ -60,256 +320,387 @@ def start_processing(state: GraphState) -> GraphState:
     return state
 
 
-def get_next_person(state: GraphState) -> GraphState:
-    if not state['people_to_process']:
-        return state
-    person = state['people_to_process'].pop(0)
+def get_next_person(state: GraphState, person: Dict[str, Any], session: aiohttp.ClientSession) -> PersonState:
     print(f"\n{'=' * 50}\n--- Processing Person: {person['NAME']} ---\n{'=' * 50}")
-    state['current_person'] = person
-    state['current_person_contacts'] = {"emails": set(), "phones": set(), "sources": {}}
-    state['social_platforms_to_search'] = ["LinkedIn", "Facebook", "Twitter", "Instagram"]
+    return {
+        "run": state,
+        "http_session": session,
+        "current_person": person,
+        "current_person_contacts": Contacts(),
+        "social_platforms_to_search": list(SOCIAL_PLATFORMS),
+        "website_done": False,
+        "limit_skipped": False,
+    }
+
+
+async def process_person(state: GraphState, person: Dict[str, Any], session: aiohttp.ClientSession,
+                         semaphore: asyncio.Semaphore) -> Optional[Dict[str, Any]]:
+    async with semaphore:
+        if state['api_calls_made'] >= state['api_call_limit']:
+            return None
+        result = await person_app.ainvoke(get_next_person(state, person, session))
+        # Not searched at all: keep them out of the report so a later run picks them up.
+        if result['limit_skipped']:
+            return None
+        return result['current_person']
+
+
+async def process_people(state: GraphState) -> GraphState:
+    """Runs the per-person graph for everyone, MAX_CONCURRENT_PEOPLE at a time."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PEOPLE)
+    connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE)
+    async with aiohttp.ClientSession(connector=connector, headers=HTTP_HEADERS, timeout=HTTP_TIMEOUT) as session:
+        while state['people_to_process']:
+            if state['api_calls_made'] >= state['api_call_limit']:
+                print("\n🚨 API CALL LIMIT REACHED! Halting all further processing.")
+                break
+            batch = state['people_to_process'][:PEOPLE_BATCH_SIZE]
+            del state['people_to_process'][:PEOPLE_BATCH_SIZE]
+            results = await asyncio.gather(*[process_person(state, p, session, semaphore) for p in batch])
+            # Results come back in input order, so the report keeps the order of data.xlsx.
+            for person in results:
+                if person is not None:
+                    state['completed_file'].write(orjson.dumps(person, default=str) + b"\n")
+                    state['completed_count'] += 1
+            # Flush once per batch so a crash loses at most the batch in flight.
+            state['completed_file'].flush()
+            await flush_email_queue(state)
     return state
 
 
-def find_and_scrape_website(state: GraphState) -> GraphState:
+async def find_and_scrape_website(state: PersonState) -> PersonState:
+    run = state['run']
     person = state['current_person']
+    progress = cache.get(progress_key(person))
+    if progress is not None and progress[0]:
+        print(f"  -> Resuming {person['NAME']} from cached progress.")
+        state['website_done'], state['current_person_contacts'], state['social_platforms_to_search'] = progress
+        return state
     print(f"  -> Phase 1: Searching for official website for {person['NAME']}")
     query = f"{person.get('NAME')} {person.get('CITY', '')} official website"
+    if is_search_cached(query):
+        print("    (Using cached search results)")
+    # Other people may have used up the budget while this one waited for its turn.
+    elif run['api_calls_made'] >= run['api_call_limit']:
+        print("    - API call limit reached. Skipping website search.")
+        state['limit_skipped'] = True
+        return state
+    else:
+        run['api_calls_made'] += 1
+        print(f"    (API Call #{run['api_calls_made']})")
     try:
-        state['api_calls_made'] += 1
-        print(f"    (API Call #{state['api_calls_made']})")
-        search_results = web_search_tool.invoke(query)
+        search_results = await cached_search(query)
         if not search_results:
             print("    - No website found in search results.")
-            return state
-        url_to_scrape = search_results[0]['url']
-        print(f"    - Found potential website: {url_to_scrape}. Now scraping.")
-        response = requests.get(url_to_scrape, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        text = soup.get_text(" ", strip=True)
-        emails = set(EMAIL_RE.findall(text))
-        phones = set(PHONE_RE.findall(text))
-        if emails or phones:
-            print(f"    ✅ Found {len(emails)} emails, {len(phones)} phones on website.")
-            state['current_person_contacts']['emails'].update(emails)
-            state['current_person_contacts']['phones'].update(phones)
-            for email in emails: state['current_person_contacts']['sources'][email] = "Official Website"
-            for phone in phones: state['current_person_contacts']['sources'][phone] = "Official Website"
+        else:
+            url_to_scrape = search_results[0]['url']
+            print(f"    - Found potential website: {url_to_scrape}. Now scraping.")
+            html = await fetch_page(state['http_session'], url_to_scrape)
+            emails, phones = extract_contacts(page_text(html))
+            if emails or phones:
+                print(f"    ✅ Found {len(emails)} emails, {len(phones)} phones on website.")
+                state['current_person_contacts'].emails.update(emails)
+                state['current_person_contacts'].phones.update(phones)
+                for email in emails: state['current_person_contacts'].sources[email] = SOURCE_WEBSITE
+                for phone in phones: state['current_person_contacts'].sources[phone] = SOURCE_WEBSITE
     except Exception as e:
+        # Not marked as done, so a later run tries the website again.
         print(f"    ❌ An error occurred during website scraping: {e}")
+        return state
+    state['website_done'] = True
+    save_progress(state)
     return state
 
 
-def search_next_social_platform(state: GraphState) -> GraphState:
-    platform = state['social_platforms_to_search'].pop(0)
+async def run_search_wave(state: PersonState, platforms: List[str], queries: Dict[str, str]) -> bool:
+    """Searches `platforms` concurrently; returns False if the API limit cut the wave short."""
+    run = state['run']
     person = state['current_person']
-    print(f"  -> Phase 2: Searching {platform} for {person['NAME']}")
-    query = f"{person.get('NAME')} {person.get('CITY', '')} {platform} contact"
-    try:
-        state['api_calls_made'] += 1
-        print(f"    (API Call #{state['api_calls_made']})")
-        resp = web_search_tool.invoke(query)
-        text = str(resp)
-        emails = set(EMAIL_RE.findall(text))
-        phones = set(PHONE_RE.findall(text))
-        if emails or phones:
-            print(f"    ✅ Found {len(emails)} emails, {len(phones)} phones via {platform} search.")
-            state['current_person_contacts']['emails'].update(emails)
-            state['current_person_contacts']['phones'].update(phones)
-            for email in emails:
-                if email not in state['current_person_contacts']['sources']:
-                    state['current_person_contacts']['sources'][email] = platform
-            for phone in phones:
-                if phone not in state['current_person_contacts']['sources']:
-                    state['current_person_contacts']['sources'][phone] = platform
-    except Exception as e:
-        print(f"    ❌ An error occurred during {platform} search: {e}")
+    contacts = state['current_person_contacts']
+    # Only searches that miss the cache cost an API call.
+    uncached = [p for p in platforms if not is_search_cached(queries[p])]
+    remaining_calls = max(run['api_call_limit'] - run['api_calls_made'], 0)
+    within_limit = remaining_calls >= len(uncached)
+    if not within_limit:
+        print("\n🚨 API CALL LIMIT REACHED! Halting further social searches for this person.")
+        # Leave the skipped platforms in the state so a later run can pick them up from the saved progress.
+        skipped = uncached[remaining_calls:]
+        state['social_platforms_to_search'].extend(skipped)
+        platforms = [p for p in platforms if p not in skipped]
+        uncached = uncached[:remaining_calls]
+
+    # Reserve the calls up front so concurrent people cannot overshoot the limit between them.
+    first_call = run['api_calls_made'] + 1
+    run['api_calls_made'] += len(uncached)
+    call_numbers = {p: first_call + i for i, p in enumerate(uncached)}
+
+    async def search_platform(platform: str) -> Any:
+        if platform in call_numbers:
+            print(f"  -> Phase 2: Searching {platform} for {person['NAME']} (API Call #{call_numbers[platform]})")
+        else:
+            print(f"  -> Phase 2: Searching {platform} for {person['NAME']} (cached)")
+        return await cached_search(queries[platform])
+
+    tasks = {asyncio.ensure_future(search_platform(p)): p for p in platforms}
+    pending = set(tasks)
+    # Handle results as they arrive and stop waiting as soon as the goal is met.
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            platform = tasks[task]
+            if task.exception() is not None:
+                print(f"    ❌ An error occurred during {platform} search: {task.exception()}")
+                # Keep it on the list so a later run retries it.
+                state['social_platforms_to_search'].append(platform)
+                continue
+            emails, phones = extract_contacts(str(task.result()))
+            if emails or phones:
+                print(f"    ✅ Found {len(emails)} emails, {len(phones)} phones via {platform} search.")
+                contacts.emails.update(emails)
+                contacts.phones.update(phones)
+                for item in emails | phones:
+                    # Results arrive in any order, so keep the attribution of the highest-ranked platform.
+                    # The official website always outranks social media.
+                    source = contacts.sources.get(item)
+                    if source is None or PLATFORM_RANK.get(source, -1) > PLATFORM_RANK[platform]:
+                        contacts.sources[item] = SOURCES[platform]
+        if pending and contacts.emails and contacts.phones:
+            print(f"  ✅ Goal met for {person['NAME']}. Not waiting for the remaining {len(pending)} searches.")
+            for task in pending:
+                task.cancel()
+            break
+    return within_limit
+
+
+async def search_social_platforms(state: PersonState) -> PersonState:
+    person = state['current_person']
+    contacts = state['current_person_contacts']
+    # Nothing left to find: don't spend API calls on this person.
+    if contacts.emails and contacts.phones:
+        state['social_platforms_to_search'] = []
+        return state
+    platforms = state['social_platforms_to_search']
+    state['social_platforms_to_search'] = []
+    queries = {p: f"{person.get('NAME')} {person.get('CITY', '')} {p} contact" for p in platforms}
+    # Cached searches are free, so they go out together with the highest-ranked uncached
+    # platform. The other platforms are only searched, and paid for, if that leaves the goal unmet.
+    uncached = [p for p in platforms if not is_search_cached(queries[p])]
+    waves = [[p for p in platforms if p not in uncached[1:]], uncached[1:]]
+    for i, wave in enumerate(waves):
+        if not wave:
+            continue
+        if contacts.emails and contacts.phones:
+            print(f"  ✅ Goal met for {person['NAME']}. Skipping the remaining {len(wave)} searches.")
+            break
+        if not await run_search_wave(state, wave, queries):
+            for later_wave in waves[i + 1:]:
+                state['social_platforms_to_search'].extend(later_wave)
+            break
+    state['social_platforms_to_search'].sort(key=PLATFORM_RANK.get)
+    save_progress(state)
     return state
 
 
-def send_email(state: GraphState) -> GraphState:
-    print("  -> Phase 3: Sending Email...")
+async def flush_email_queue(state: GraphState) -> None:
+    """Sends every queued email over a single SMTP connection and logs the ones that went out."""
+    queue = state['email_queue']
+    if not queue:
+        return
+    state['email_queue'] = []
+    print(f"\n  -> Sending {len(queue)} queued emails...")
+
+    async def send_one(smtp: aiosmtplib.SMTP, msg: EmailMessage) -> str:
+        await smtp.send_message(msg)
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    try:
+        async with aiosmtplib.SMTP(hostname="smtp.gmail.com", port=465, use_tls=True) as smtp:
+            await smtp.login(SENDER_EMAIL, SENDER_PASSWORD)
+            # aiosmtplib runs one transaction at a time on the connection; gather just queues them all.
+            results = await asyncio.gather(*[send_one(smtp, msg) for msg, *_ in queue], return_exceptions=True)
+    except Exception as e:
+        print(f"    ❌ Failed to send {len(queue)} queued emails: {e}")
+        return
+
+    log = state['email_log_cols']
+    for (msg, recipient_name, recipient_email, source), result in zip(queue, results):
+        if isinstance(result, Exception):
+            print(f"    ❌ Failed to send email to {recipient_email}: {result}")
+            continue
+        print(f"    ✅ Email sent successfully to {recipient_name} at {recipient_email}")
+        log["Timestamp"].append(result)
+        log["Name"].append(recipient_name)
+        log["Email Sent To"].append(recipient_email)
+        log["Source of Email"].append(source)
+
+
+def queue_email(state: PersonState) -> PersonState:
+    print("  -> Phase 3: Queueing Email...")
     contacts = state['current_person_contacts']
     person = state['current_person']
-    if not contacts['emails']:
+    if not contacts.emails:
         print("    - No email address found. Skipping email.")
         return state
-    sender_email = os.getenv("EMAIL_SENDER")
-    sender_password = os.getenv("EMAIL_PASSWORD")
-    if not sender_email or not sender_password:
+    if not SENDER_EMAIL or not SENDER_PASSWORD:
         print("    ❌ Email credentials not found in .env file. Skipping email.")
         return state
-    recipient_email = list(contacts['emails'])[0]
+    recipient_email = list(contacts.emails)[0]
     recipient_name = person.get("NAME", "there")
     msg = EmailMessage()
     msg['Subject'] = f"A quick question, {recipient_name}"
-    msg['From'] = sender_email
+    msg['From'] = SENDER_EMAIL
     msg['To'] = recipient_email
     body = f"Hi {recipient_name},\n\nI hope this message finds you well.\n\nI found your contact information online and wanted to reach out regarding a potential collaboration.\n\nBest regards,\n[Your Name]"
     msg.set_content(body)
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-            print(f"    ✅ Email sent successfully to {recipient_name} at {recipient_email}")
-            state['emails_sent_log'].append({
-                "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "Name": recipient_name,
-                "Email Sent To": recipient_email,
-                "Source of Email": contacts['sources'].get(recipient_email, "Unknown")
-            })
-    except Exception as e:
-        print(f"    ❌ Failed to send email to {recipient_email}: {e}")
+    # Emails are sent in bulk by flush_email_queue once the current batch of people is done.
+    state['run']['email_queue'].append(
+        (msg, recipient_name, recipient_email, contacts.sources.get(recipient_email, "Unknown")))
     return state
 
 
-def save_and_loop(state: GraphState) -> GraphState:
+def save_person(state: PersonState) -> PersonState:
     person = state['current_person']
     contacts = state['current_person_contacts']
-    person['Emails'] = ", ".join(sorted(contacts['emails']))
-    person['Phones'] = ", ".join(sorted(contacts['phones']))
-    source_list = [f"{item} ({source})" for item, source in contacts['sources'].items()]
-    person['Contact Sources'] = "; ".join(sorted(source_list))
-    state['completed_people'].append(person)
+    person['Emails'] = ", ".join(sorted(contacts.emails))
+    person['Phones'] = ", ".join(sorted(contacts.phones))
+    sources = contacts.sources
+    person['Contact Sources'] = "; ".join(f"{item} ({sources[item]})" for item in sorted(sources))
+    state['run']['platform_counts'].update(contacts.sources.values())
     print(f"--- Finished processing {person['NAME']}. Data saved. ---")
     return state
 
 
+def write_sheet(workbook: xlsxwriter.Workbook, sheet_name: str, headers: List[str],
+                rows: Iterable[Sequence[Any]], header_format: Any) -> None:
+    """Writes a header row and then `rows` to a new sheet, one row at a time."""
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, headers, header_format)
+    for row_number, row in enumerate(rows, start=1):
+        worksheet.write_row(row_number, 0, row)
+
+
+def read_completed_rows(path: str, columns: List[str]) -> Iterable[List[Any]]:
+    """Streams the completed people back from the JSON Lines file as report rows."""
+    with open(path, "rb") as f:
+        for line in f:
+            person = orjson.loads(line)
+            yield [person.get(column) for column in columns]
+
+
 # <<< THIS IS THE ONLY NODE THAT HAS BEEN MODIFIED >>>
 def generate_final_report(state: GraphState) -> GraphState:
-    """Writes all collected data to timestamped Excel files in a 'reports' folder."""
+    """Writes all collected data to a timestamped Excel workbook in a 'reports' folder."""
     print(f"\n{'=' * 50}\n--- All People Processed. Generating Final Reports. ---\n{'=' * 50}")
     print(f"Total API Calls Made: {state['api_calls_made']} (Limit was {state['api_call_limit']})")
 
     # --- Start of New Logic ---
-    # 1. Define the output folder and create a consistent timestamp for this run
-    output_folder = "reports"
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")  # Filename-safe format
+    # 1. Define the output folder; RUN_TIMESTAMP keeps file names consistent for this run
+    output_folder = OUTPUT_FOLDER
+    timestamp = RUN_TIMESTAMP
 
     # 2. Ensure the output folder exists. Create it if it doesn't.
     os.makedirs(output_folder, exist_ok=True)
     print(f"Reports will be saved in the '{output_folder}/' directory.")
     # --- End of New Logic ---
 
-    if not state['completed_people']:
+    state['completed_file'].close()
+    if not state['completed_count']:
+        os.remove(state['completed_path'])
         print("⚠️ No data was processed to generate a report.")
         return state
 
-    # 3. Main Output File with new timestamped path
-    main_report_filename = f"output_with_contacts_{timestamp}.xlsx"
-    main_report_filepath = os.path.join(output_folder, main_report_filename)
-    pd.DataFrame(state['completed_people']).to_excel(main_report_filepath, index=False)
-    print(f"✅ Main export complete: {main_report_filepath}")
-
-    # 4. Email Sent Log with new timestamped path
-    if state['emails_sent_log']:
-        email_log_filename = f"emails_sent_log_{timestamp}.xlsx"
-        email_log_filepath = os.path.join(output_folder, email_log_filename)
-        pd.DataFrame(state['emails_sent_log']).to_excel(email_log_filepath, index=False)
-        print(f"✅ Email log complete: {email_log_filepath}")
-
-    # 5. Effectiveness Report with new timestamped path
-    platform_counts = {}
-    for person in state['completed_people']:
-        sources_str = person.get('Contact Sources', '')
-        sources_list = re.findall(r'\((.*?)\)', sources_str)
-        for source in sources_list:
-            platform_counts[source] = platform_counts.get(source, 0) + 1
-    if platform_counts:
-        effectiveness_filename = f"platform_effectiveness_report_{timestamp}.xlsx"
-        effectiveness_filepath = os.path.join(output_folder, effectiveness_filename)
-        report_df = pd.DataFrame(list(platform_counts.items()), columns=['Platform', 'Contacts Found'])
-        report_df = report_df.sort_values(by="Contacts Found", ascending=False)
-        report_df.to_excel(effectiveness_filepath, index=False)
-        print(f"✅ Effectiveness report complete: {effectiveness_filepath}")
-
+    # 3. One timestamped workbook with a sheet per report, written with a single writer
+    report_filename = f"contacts_report_{timestamp}.xlsx"
+    report_filepath = os.path.join(output_folder, report_filename)
+    # Rows are written in order, so constant_memory can flush each row as soon as it's done.
+    # Scraped text is never turned into formulas or links.
+    with xlsxwriter.Workbook(report_filepath, {'constant_memory': True, 'strings_to_formulas': False,
+                                               'strings_to_urls': False}) as workbook:
+        header_format = workbook.add_format({'bold': True, 'border': 1})
+
+        # Main output sheet
+        write_sheet(workbook, "Contacts", state['completed_columns'],
+                    read_completed_rows(state['completed_path'], state['completed_columns']), header_format)
+        print(f"✅ Main export complete: {report_filepath} [Contacts]")
+
+        # Email Sent Log sheet
+        if state['email_log_cols']['Timestamp']:
+            log = state['email_log_cols']
+            write_sheet(workbook, "Email Log", list(log), zip(*log.values()), header_format)
+            print(f"✅ Email log complete: {report_filepath} [Email Log]")
+
+        # Effectiveness Report sheet
+        if state['platform_counts']:
+            write_sheet(workbook, "Platform Effectiveness", ['Platform', 'Contacts Found'],
+                        state['platform_counts'].most_common(), header_format)
+            print(f"✅ Effectiveness report complete: {report_filepath} [Platform Effectiveness]")
+
+    # The workbook now holds everything the in-progress file did.
+    os.remove(state['completed_path'])
     print("--- Workflow Finished ---")
     return state
 
 
 # --- 4. CONDITIONAL LOGIC FUNCTIONS ---
-def check_api_limit_before_processing(state: GraphState) -> str:
-    if state['api_calls_made'] >= state['api_call_limit']:
-        print("\n🚨 API CALL LIMIT REACHED! Halting all further processing.")
-        return "limit_reached"
-    else:
-        return "can_proceed"
-
-
-def should_continue_to_social(state: GraphState) -> str:
+def should_continue_to_social(state: PersonState) -> str:
+    if state['limit_skipped']:
+        return "end"
     contacts = state['current_person_contacts']
-    if contacts['emails'] and contacts['phones']:
+    if contacts.emails and contacts.phones:
         print("  ✅ Goal met on website. Proceeding to send email.")
-        return "send_email"
+        return "queue_email"
     else:
         print("  - Goal not met. Continuing to social media.")
         return "search_social"
 
 
-def should_continue_social_search(state: GraphState) -> str:
+def should_send_email_after_social(state: PersonState) -> str:
     contacts = state['current_person_contacts']
-    if contacts['emails'] and contacts['phones']:
+    if contacts.emails and contacts.phones:
         print("  ✅ Goal met on social media. Proceeding to send email.")
-        return "send_email"
-    if state['api_calls_made'] >= state['api_call_limit']:
-        print("\n🚨 API CALL LIMIT REACHED! Halting further social searches for this person.")
-        return "save_and_loop"
-    if not state['social_platforms_to_search']:
-        print("  - No more social platforms to search for this person.")
-        return "save_and_loop"
-    return "continue_social_search"
+        return "queue_email"
+    print("  - No more social platforms to search for this person.")
+    return "save_person"
 
 
-def should_continue_processing(state: GraphState) -> str:
-    if state['people_to_process']:
-        return "get_next_person"
-    else:
-        return "generate_final_report"
-
+# --- 5. BUILD THE GRAPHS ---
+# Per-person graph: website first, then all social platforms at once, then outreach.
+person_graph_builder.add_node("find_and_scrape_website", find_and_scrape_website)
+person_graph_builder.add_node("search_social_platforms", search_social_platforms)
+person_graph_builder.add_node("queue_email", queue_email)
+person_graph_builder.add_node("save_person", save_person)
 
-# --- 5. BUILD THE GRAPH ---
-graph_builder.add_node("start_processing", start_processing)
-graph_builder.add_node("get_next_person", get_next_person)
-graph_builder.add_node("find_and_scrape_website", find_and_scrape_website)
-graph_builder.add_node("search_next_social_platform", search_next_social_platform)
-graph_builder.add_node("send_email", send_email)
-graph_builder.add_node("save_and_loop", save_and_loop)
-graph_builder.add_node("generate_final_report", generate_final_report)
+person_graph_builder.add_edge(START, "find_and_scrape_website")
 
-graph_builder.add_edge(START, "start_processing")
-graph_builder.add_edge("start_processing", "get_next_person")
-
-graph_builder.add_conditional_edges(
-    "get_next_person",
-    check_api_limit_before_processing,
-    {"can_proceed": "find_and_scrape_website", "limit_reached": "generate_final_report"}
-)
-
-graph_builder.add_conditional_edges(
+person_graph_builder.add_conditional_edges(
     "find_and_scrape_website",
     should_continue_to_social,
-    {"send_email": "send_email", "search_social": "search_next_social_platform", "save_and_loop": "save_and_loop"}
+    {"queue_email": "queue_email", "search_social": "search_social_platforms", "save_person": "save_person",
+     "end": END}
 )
 
-graph_builder.add_conditional_edges(
-    "search_next_social_platform",
-    should_continue_social_search,
-    {"send_email": "send_email", "continue_social_search": "search_next_social_platform",
-     "save_and_loop": "save_and_loop"}
+person_graph_builder.add_conditional_edges(
+    "search_social_platforms",
+    should_send_email_after_social,
+    {"queue_email": "queue_email", "save_person": "save_person"}
 )
 
-graph_builder.add_edge("send_email", "save_and_loop")
+person_graph_builder.add_edge("queue_email", "save_person")
+person_graph_builder.add_edge("save_person", END)
 
-graph_builder.add_conditional_edges(
-    "save_and_loop",
-    should_continue_processing,
-    {"get_next_person": "get_next_person", "generate_final_report": "generate_final_report"}
-)
+person_app = person_graph_builder.compile()
+
+# Run graph: read the input, fan out over people, then write the reports.
+graph_builder.add_node("start_processing", start_processing)
+graph_builder.add_node("process_people", process_people)
+graph_builder.add_node("generate_final_report", generate_final_report)
 
+graph_builder.add_edge(START, "start_processing")
+graph_builder.add_edge("start_processing", "process_people")
+graph_builder.add_edge("process_people", "generate_final_report")
 graph_builder.add_edge("generate_final_report", END)
 
 # --- 6. COMPILE AND RUN ---
 if __name__ == "__main__":
     app = graph_builder.compile()
-    app.invoke({})
\ No newline at end of file
+    asyncio.run(app.ainvoke({}))
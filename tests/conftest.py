@@ -0,0 +1,6 @@
+import os
+import sys
+
+# main.py initializes the Tavily tool at import time; a placeholder key is enough for tests.
+os.environ.setdefault("TAVILY_API_KEY", "test-key")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+import datetime
+
+import diskcache
+import orjson
+import pytest
+
+import main
+
+
+def test_page_text_ignores_asset_names_in_attributes():
+    html = '<img src="logo@2x.png" srcset="hero@3x.webp 3x"><p>contact info@org.org</p>'
+    emails, phones = main.extract_contacts(main.page_text(html))
+    assert emails == {"info@org.org"}
+    assert phones == set()
+
+
+def test_page_text_keeps_mailto_and_tel_links():
+    html = '<a href="mailto:boss%40org.org?subject=Hi">Email</a> <a href="tel:+1-312-555-1234">Call</a>'
+    emails, phones = main.extract_contacts(main.page_text(html))
+    assert emails == {"boss@org.org"}
+    assert phones == {"+1-312-555-1234"}
+
+
+def test_extract_contacts_rejects_file_extension_tlds():
+    emails, _ = main.extract_contacts("icon@2x.png banner@3x.jpg style@v2.css real@org.org")
+    assert emails == {"real@org.org"}
+
+
+@pytest.mark.skipif(main.CONTACT_DB is None, reason="python-hyperscan is not installed")
+@pytest.mark.parametrize("text", [
+    "91 555 123 4567",
+    "tel:21-555-123-4567",
+    "order 123456789012 call (312) 555-1234 or +1 312.555.9876",
+    "a@b.org 2024-05-15 12345 312-555-0000x",
+    "\néx@b.xx café@bar.org ü.x@b.co",
+])
+def test_hyperscan_and_regex_paths_agree(monkeypatch, text):
+    hyperscan_result = main.extract_contacts(text)
+    monkeypatch.setattr(main, "CONTACT_DB", None)
+    assert main.extract_contacts(text) == hyperscan_result
+
+
+def test_input_cells_survive_the_completed_file():
+    row = ["Ann", 7, 1.5, True, datetime.date(2024, 5, 15), datetime.datetime(2024, 5, 15, 9, 30),
+           datetime.timedelta(hours=1)]
+    person = dict(zip(map(str, range(len(row))), map(main._input_cell, row)))
+    assert orjson.loads(orjson.dumps(person)) == {
+        "0": "Ann", "1": 7, "2": 1.5, "3": True, "4": "2024-05-15", "5": "2024-05-15 09:30:00", "6": "1:00:00",
+    }
+
+
+def test_failed_search_is_not_cached(monkeypatch, tmp_path):
+    class FailingSearch:
+        def invoke(self, query):
+            return "HTTPError('429 Client Error: Too Many Requests')"
+
+    monkeypatch.setattr(main, "web_search_tool", FailingSearch())
+    monkeypatch.setattr(main, "cache", diskcache.Cache(str(tmp_path)))
+    with pytest.raises(RuntimeError, match="429"):
+        main._search_and_cache("Ann Chicago official website")
+    assert not main.is_search_cached("Ann Chicago official website")